@@ -3,6 +3,9 @@ const DeviceAssignment = require('../models/DeviceAssignment');
 const SensorReading = require('../models/SensorReading');
 const axios = require('axios');
 
+// Also sent as X-Request-Timeout-Ms so the ML service drops the work once we stop waiting
+const ML_TIMEOUT_MS = 10000;
+
 class PredictionController {
   constructor() {
     this.ML_API_URL = process.env.ML_API_URL || 'http://localhost:8000/predict';
@@ -140,7 +143,8 @@ class PredictionController {
       
       // Call ML service
       const mlResponse = await axios.post(this.ML_API_URL, features, {
-        timeout: 10000
+        timeout: ML_TIMEOUT_MS,
+        headers: { 'X-Request-Timeout-Ms': String(ML_TIMEOUT_MS) }
       });
       
       // Save prediction
@@ -0,0 +1,77 @@
+"""Benchmark: added latency of explanations vs a plain prediction
+
+Run from this directory (the service loads model.pkl / scaler.pkl from the cwd):
+    EXPLAIN_ENABLED=1 python benchmark_explain.py [rows]
+"""
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import fastapi_service as service
+
+warnings.filterwarnings("ignore", category=UserWarning)
+
+def per_row_ms(func, rows: int, repeats: int = 3, cold_cache: bool = True) -> float:
+    """Best of N runs, in ms per row"""
+    best = float("inf")
+    for _ in range(repeats):
+        if cold_cache:
+            service.explain_cache.clear()
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000 / rows
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    if service.tree_explainer is None:
+        print(f"❌ {service.explain_unavailable_reason}, nothing to benchmark")
+        return
+
+    # Lignes aléatoires dans les bornes de l'API
+    rng = np.random.default_rng(0)
+    bounds = service.feature_bounds()
+    raw = np.column_stack([rng.uniform(lo, hi, n_rows) for lo, hi in bounds])
+    df = pd.DataFrame(raw, columns=service.feature_names)
+    X = service.scaler.transform(df) if service.scaler else df.values
+    single_rows = [X[i:i + 1] for i in range(n_rows)]
+
+    def plain_single():
+        for row in single_rows:
+            service.model_inference(row)
+
+    def explain_single():
+        for row in single_rows:
+            service.model_inference(row, explain=True)
+
+    def plain_batch():
+        service.model_inference(X)
+
+    def explain_batch():
+        service.model_inference(X, explain=True)
+
+    print("\n" + "=" * 60)
+    print(f"⏱️ EXPLANATION BENCHMARK ({n_rows} rows, {service.tree_explainer['method']}, {type(service.model).__name__})")
+    print("=" * 60)
+
+    results = {
+        "single / plain": per_row_ms(plain_single, n_rows),
+        "single / explain (cold cache)": per_row_ms(explain_single, n_rows),
+        "single / explain (warm cache)": per_row_ms(explain_single, n_rows, cold_cache=False),
+        "batch / plain": per_row_ms(plain_batch, n_rows),
+        "batch / explain (cold cache)": per_row_ms(explain_batch, n_rows),
+    }
+
+    for name, ms in results.items():
+        print(f"   {name:<32} {ms:8.3f} ms/row")
+
+    print(f"\n📊 Added per row (single, cold): {results['single / explain (cold cache)'] - results['single / plain']:.3f} ms")
+    print(f"📊 Added per row (batch, cold):  {results['batch / explain (cold cache)'] - results['batch / plain']:.3f} ms")
+    print("=" * 60)
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,25 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel, Field, ConfigDict
+import asyncio
+import bisect
+import hmac
+import inspect
 import pickle
 import pandas as pd
 import numpy as np
 import os
+import queue
+import random
+import sys
+import threading
+import time
+import tracemalloc
 import traceback
 import uvicorn
+from collections import OrderedDict, deque
 from datetime import datetime
 from typing import Optional
 
@@ -28,6 +41,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ====== ARRIVAL TIMESTAMP ======
+class ArrivalStampMiddleware:
+    """Stamp arrival time so deadlines count time spent queued (plain ASGI, keeps disconnect detection working)"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["received_at"] = time.monotonic()
+        await self.app(scope, receive, send)
+
+app.add_middleware(ArrivalStampMiddleware)
+
 print("=" * 60)
 print(" BotaniAI ML Prediction Service - Starting...")
 print("=" * 60)
@@ -37,6 +63,63 @@ model = None
 scaler = None
 feature_names = []
 
+# ====== DEADLINE / INFERENCE QUEUE CONFIGURATION ======
+# Callers may send X-Request-Timeout-Ms (or a timeout_ms field); otherwise this default applies
+DEFAULT_DEADLINE_MS = float(os.getenv("DEFAULT_DEADLINE_MS", "10000"))
+MAX_DEADLINE_MS = 600000
+INFERENCE_CONCURRENCY = int(os.getenv("INFERENCE_CONCURRENCY", "4"))
+
+inference_semaphore = asyncio.Semaphore(INFERENCE_CONCURRENCY)
+inference_waiting = 0  # requests queued for the model
+service_stats = {"inference_requests": 0, "completed": 0, "expired": 0, "client_disconnected": 0}
+
+# ====== ADMIN / PROFILING CONFIGURATION ======
+# Admin endpoints are disabled unless ADMIN_TOKEN is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_MAX_SECONDS = 60
+
+profile_lock = asyncio.Lock()
+
+# ====== GRID INDEX CONFIGURATION ======
+# Optional quantized decision grid for O(1) approximate predictions (GRID_INDEX=1)
+GRID_INDEX_ENABLED = os.getenv("GRID_INDEX", "0") == "1"
+GRID_INDEX_MAX_MB = float(os.getenv("GRID_INDEX_MAX_MB", "2"))
+GRID_INDEX_HOLDOUT = int(os.getenv("GRID_INDEX_HOLDOUT", "2000"))
+GRID_INDEX_MAX_ERROR = float(os.getenv("GRID_INDEX_MAX_ERROR", "0.05"))  # holdout error above this: no index
+GRID_UNIFORM_BINS = 16  # bins for a feature when the model exposes no split thresholds
+GRID_BUILD_CHUNK = 65536
+
+grid_index = None
+grid_index_unavailable_reason = "Grid index disabled (set GRID_INDEX=1)"
+
+# ====== EXPLANATION CONFIGURATION ======
+# Per-feature contributions from the tree paths, cached by input row (EXPLAIN_ENABLED=1)
+EXPLAIN_ENABLED = os.getenv("EXPLAIN_ENABLED", "0") == "1"
+EXPLAIN_MAX_MB = float(os.getenv("EXPLAIN_MAX_MB", "64"))
+EXPLAIN_CACHE_SIZE = int(os.getenv("EXPLAIN_CACHE_SIZE", "1024"))
+
+tree_explainer = None
+explain_unavailable_reason = "Explanations disabled (set EXPLAIN_ENABLED=1)"
+explain_cache = OrderedDict()
+explain_cache_lock = threading.Lock()
+explain_stats = {"rows": 0, "cache_hits": 0}
+
+# ====== SHADOW MODEL CONFIGURATION ======
+# Optional candidate model scored in the background against sampled /predict traffic
+SHADOW_MODEL_FILE = os.getenv("SHADOW_MODEL_FILE", "candidate_model.pkl")
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.1"))
+SHADOW_QUEUE_SIZE = int(os.getenv("SHADOW_QUEUE_SIZE", "64"))
+SHADOW_LATENCY_WINDOW = 1000
+
+shadow_model = None
+shadow_scaler = None
+shadow_queue = queue.Queue(maxsize=SHADOW_QUEUE_SIZE)
+shadow_lock = threading.Lock()
+shadow_stats = {"sampled": 0, "scored": 0, "agreements": 0, "shed": 0, "errors": 0}
+shadow_confusion = {}  # (primary_class, candidate_class) -> count
+shadow_primary_latencies = deque(maxlen=SHADOW_LATENCY_WINDOW)
+shadow_candidate_latencies = deque(maxlen=SHADOW_LATENCY_WINDOW)
+
 # ====== PYDANTIC MODELS (FIXED) ======
 class PredictionRequest(BaseModel):
     """Request model with proper aliases for % signs"""
@@ -64,6 +147,13 @@ class PredictionRequest(BaseModel):
         alias="Soil_Moisture_%"  # ← API expects Soil_Moisture_%
     )
     
+    # Not a feature: request budget in ms (the X-Request-Timeout-Ms header wins).
+    # No bounds here: get_deadline caps it / falls back to the default like the header
+    timeout_ms: Optional[float] = Field(default=None, description="Request deadline in ms")
+    
+    # Not a feature either: same as the ?explain=true query flag
+    explain: Optional[bool] = Field(default=False, description="Return per-feature contributions")
+    
     model_config = ConfigDict(
         populate_by_name=True,  # Allows using alias names
         str_strip_whitespace=True,
@@ -376,27 +466,26 @@ def get_prediction_description(pred_class: int) -> str:
     }
     return descriptions.get(pred_class, f"Unknown class {pred_class}")
 
+FEATURE_DEFAULTS = {
+    "Height_cm": 30.0,
+    "Leaf_Count": 12.0,
+    "New_Growth_Count": 2.0,
+    "Watering_Amount_ml": 250.0,
+    "Watering_Frequency_days": 3.0,
+    "Room_Temperature_C": 24.0,
+    "Humidity_%": 55.0,
+    "Soil_Moisture_%": 50.0
+}
+
 def prepare_features(input_dict: dict) -> pd.DataFrame:
     """Prepare features for model"""
     # Ensure all features exist
-    defaults = {
-        "Height_cm": 30.0,
-        "Leaf_Count": 12.0,
-        "New_Growth_Count": 2.0,
-        "Watering_Amount_ml": 250.0,
-        "Watering_Frequency_days": 3.0,
-        "Room_Temperature_C": 24.0,
-        "Humidity_%": 55.0,
-        "Soil_Moisture_%": 50.0
-    }
-    
-    # Update with input
-    features = {**defaults, **input_dict}
+    features = {**FEATURE_DEFAULTS, **input_dict}
     
     # Ensure correct feature order
     ordered_features = {}
     for feature in feature_names:
-        ordered_features[feature] = features.get(feature, defaults.get(feature, 0.0))
+        ordered_features[feature] = features.get(feature, FEATURE_DEFAULTS.get(feature, 0.0))
     
     # Créer le DataFrame avec les noms de colonnes
     df = pd.DataFrame([ordered_features])
@@ -406,6 +495,774 @@ def prepare_features(input_dict: dict) -> pd.DataFrame:
     
     return df
 
+# ====== SHADOW MODEL ======
+def load_shadow_model():
+    """Load the optional candidate model evaluated beside the primary one"""
+    global shadow_model, shadow_scaler
+
+    if not os.path.exists(SHADOW_MODEL_FILE):
+        print(f"\n⏭️ No candidate model ({SHADOW_MODEL_FILE}), shadow evaluation disabled")
+        return False
+
+    try:
+        with open(SHADOW_MODEL_FILE, "rb") as f:
+            content = pickle.load(f)
+
+        # Même format que model.pkl : modèle direct ou dictionnaire
+        if isinstance(content, dict):
+            for key, value in content.items():
+                if shadow_model is None and hasattr(value, 'predict'):
+                    shadow_model = value
+                elif shadow_scaler is None and hasattr(value, 'transform'):
+                    shadow_scaler = value
+        elif hasattr(content, 'predict'):
+            shadow_model = content
+
+        if shadow_model is None:
+            print(f"❌ {SHADOW_MODEL_FILE} doesn't contain a valid sklearn model")
+            return False
+
+        print(f"\n👥 CANDIDATE MODEL LOADED from {SHADOW_MODEL_FILE}")
+        print(f"   Model type: {type(shadow_model).__name__}")
+        print(f"   Scaler: {type(shadow_scaler).__name__ if shadow_scaler else 'primary scaler'}")
+        print(f"   Sample rate: {SHADOW_SAMPLE_RATE:.0%}, queue size: {SHADOW_QUEUE_SIZE}")
+        return True
+
+    except Exception as e:
+        print(f"❌ Error loading {SHADOW_MODEL_FILE}: {e}")
+        shadow_model = None
+        shadow_scaler = None
+        return False
+
+def shed_shadow_under_load() -> bool:
+    """Drop (and count) shadow work while requests are waiting for the primary model"""
+    if inference_waiting == 0:
+        return False
+    with shadow_lock:
+        shadow_stats["shed"] += 1
+    return True
+
+def submit_shadow(df: pd.DataFrame, primary_class: int, primary_latency_ms: float):
+    """Hand a sampled request to the shadow worker without ever blocking"""
+    if shadow_model is None or random.random() >= SHADOW_SAMPLE_RATE:
+        return
+
+    if shed_shadow_under_load():
+        return
+
+    try:
+        shadow_queue.put_nowait((df, primary_class, primary_latency_ms))
+        with shadow_lock:
+            shadow_stats["sampled"] += 1
+    except queue.Full:
+        # Shadow work is always the first thing we drop
+        with shadow_lock:
+            shadow_stats["shed"] += 1
+
+def shadow_worker():
+    """Score queued requests with the candidate model, off the request path"""
+    while True:
+        df, primary_class, primary_latency_ms = shadow_queue.get()
+        try:
+            # Checked again: load may have arrived while this sample was queued
+            if shed_shadow_under_load():
+                continue
+
+            candidate_scaler = shadow_scaler or scaler
+            X = candidate_scaler.transform(df) if candidate_scaler else df.values
+            # Same scope as the primary latency (model_inference): predict + predict_proba
+            start = time.perf_counter()
+            candidate_class = int(shadow_model.predict(X)[0])
+            if hasattr(shadow_model, 'predict_proba'):
+                shadow_model.predict_proba(X)
+            candidate_latency_ms = (time.perf_counter() - start) * 1000
+
+            with shadow_lock:
+                shadow_stats["scored"] += 1
+                if candidate_class == primary_class:
+                    shadow_stats["agreements"] += 1
+                pair = (primary_class, candidate_class)
+                shadow_confusion[pair] = shadow_confusion.get(pair, 0) + 1
+                shadow_primary_latencies.append(primary_latency_ms)
+                shadow_candidate_latencies.append(candidate_latency_ms)
+        except Exception as e:
+            print(f"⚠️ Shadow scoring error: {e}")
+            with shadow_lock:
+                shadow_stats["errors"] += 1
+        finally:
+            shadow_queue.task_done()
+
+def summarize_latencies(latencies) -> dict:
+    """Mean / p50 / p95 / p99 in milliseconds"""
+    if not latencies:
+        return {"count": 0}
+    values = np.array(latencies)
+    return {
+        "count": len(values),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+
+if load_shadow_model():
+    threading.Thread(target=shadow_worker, name="shadow-worker", daemon=True).start()
+
+# ====== GRID INDEX ======
+def feature_bounds() -> list:
+    """(min, max) per model feature, taken from the PredictionRequest ge/le limits"""
+    api_bounds = []
+    for name, field in PredictionRequest.model_fields.items():
+        lo = next((m.ge for m in field.metadata if hasattr(m, 'ge')), None)
+        hi = next((m.le for m in field.metadata if hasattr(m, 'le')), None)
+        if name != "timeout_ms" and lo is not None and hi is not None:
+            api_bounds.append((field.alias or name, float(lo), float(hi)))
+
+    by_name = {api_name: (lo, hi) for api_name, lo, hi in api_bounds}
+    bounds = []
+    for i, feature in enumerate(feature_names):
+        if feature in by_name:
+            bounds.append(by_name[feature])
+        else:
+            # Noms génériques (feature_0...) : même ordre que l'API
+            bounds.append(api_bounds[i][1:])
+    return bounds
+
+def booster_kind(estimator) -> Optional[str]:
+    """'xgboost' / 'lightgbm' for gradient-boosting models with built-in tree dumps / TreeSHAP"""
+    if hasattr(estimator, 'get_booster'):
+        return "xgboost"
+    if hasattr(estimator, 'booster_'):
+        return "lightgbm"
+    return None
+
+def collect_split_thresholds(estimator, thresholds: list):
+    """Append (feature, threshold) splits of every tree inside estimator
+
+    sklearn trees/forests, XGBoost and LightGBM models, and the base learners of a stack.
+    """
+    if hasattr(estimator, 'tree_'):
+        tree = estimator.tree_
+        is_split = tree.feature >= 0
+        for feature, threshold in zip(tree.feature[is_split], tree.threshold[is_split]):
+            thresholds[feature].append(threshold)
+    elif booster_kind(estimator) == "xgboost":
+        booster = estimator.get_booster()
+        names = booster.feature_names or [f"f{i}" for i in range(len(thresholds))]
+        index = {name: i for i, name in enumerate(names)}
+        trees = booster.trees_to_dataframe()
+        splits = trees[trees["Feature"] != "Leaf"]
+        for feature, threshold in zip(splits["Feature"], splits["Split"]):
+            thresholds[index[feature]].append(threshold)
+    elif booster_kind(estimator) == "lightgbm":
+        index = {name: i for i, name in enumerate(estimator.booster_.feature_name())}
+        trees = estimator.booster_.trees_to_dataframe()
+        splits = trees[trees["split_feature"].notna()]
+        for feature, threshold in zip(splits["split_feature"], splits["threshold"]):
+            thresholds[index[feature]].append(threshold)
+    elif hasattr(estimator, 'named_estimators_'):
+        # StackingClassifier / VotingClassifier : les seuils viennent des modèles de base
+        for sub_estimator in estimator.named_estimators_.values():
+            if not isinstance(sub_estimator, str):
+                collect_split_thresholds(sub_estimator, thresholds)
+    elif hasattr(estimator, 'estimators_'):
+        for sub_estimator in np.ravel(np.asarray(estimator.estimators_, dtype=object)):
+            collect_split_thresholds(sub_estimator, thresholds)
+
+def raw_split_thresholds(bounds: list) -> list:
+    """Split thresholds per feature, mapped back to raw (unscaled) units"""
+    n_features = len(feature_names)
+    thresholds = [[] for _ in range(n_features)]
+    collect_split_thresholds(model, thresholds)
+
+    raw = []
+    for j, (lo, hi) in enumerate(bounds):
+        values = np.array(thresholds[j], dtype=float)
+        if len(values) and scaler is not None and hasattr(scaler, 'inverse_transform'):
+            scaled = np.zeros((len(values), n_features))
+            scaled[:, j] = values
+            values = scaler.inverse_transform(scaled)[:, j]
+        raw.append(np.sort(values[(values > lo) & (values < hi)]))
+    return raw
+
+def allocate_bins(raw_thresholds: list, max_cells: int) -> list:
+    """Bins per feature: grow the most important features first, within max_cells"""
+    n_features = len(raw_thresholds)
+    caps = [len(np.unique(t)) + 1 if len(t) else GRID_UNIFORM_BINS for t in raw_thresholds]
+
+    if hasattr(model, 'feature_importances_'):
+        importance = np.asarray(model.feature_importances_, dtype=float) + 1e-9
+    else:
+        importance = np.array([len(t) + 1.0 for t in raw_thresholds])
+
+    bins = [1] * n_features
+    cells = 1
+    while True:
+        candidates = [j for j in range(n_features)
+                      if bins[j] < caps[j] and cells // bins[j] * (bins[j] + 1) <= max_cells]
+        if not candidates:
+            return bins
+        j = max(candidates, key=lambda k: importance[k] / bins[k])
+        cells = cells // bins[j] * (bins[j] + 1)
+        bins[j] += 1
+
+def bin_edges(thresholds: np.ndarray, n_bins: int, lo: float, hi: float) -> list:
+    """Interior cut points: quantiles of the split thresholds (finer where they cluster)"""
+    if n_bins <= 1:
+        return []
+    if not len(thresholds):
+        return list(np.linspace(lo, hi, n_bins + 1)[1:-1])
+    levels = np.arange(1, n_bins) / n_bins
+    cuts = np.quantile(thresholds, levels, method='nearest')
+    return sorted(set(float(c) for c in cuts))
+
+def grid_cell(values, edges: list, strides: list) -> int:
+    """Flat cell index of a feature vector (x <= cut goes left, like the trees)"""
+    cell = 0
+    for value, feature_edges, stride in zip(values, edges, strides):
+        cell += bisect.bisect_left(feature_edges, value) * stride
+    return cell
+
+def build_grid_index():
+    """Precompute class + confidence for every grid cell, within GRID_INDEX_MAX_MB and GRID_INDEX_MAX_ERROR"""
+    global grid_index, grid_index_unavailable_reason
+
+    print("\n" + "=" * 60)
+    print("🗺️ BUILDING GRID INDEX...")
+    print("=" * 60)
+
+    if not hasattr(model, 'predict_proba'):
+        grid_index_unavailable_reason = "Model doesn't have predict_proba"
+        print(f"⚠️ {grid_index_unavailable_reason}, grid index skipped")
+        return False
+
+    try:
+        start = time.perf_counter()
+        classes = np.asarray(model.classes_)
+        bounds = feature_bounds()
+        raw_thresholds = raw_split_thresholds(bounds)
+
+        # 1 octet de classe + 1 octet de confiance par cellule
+        max_cells = int(GRID_INDEX_MAX_MB * 1024 * 1024) // 2
+        bins = allocate_bins(raw_thresholds, max_cells)
+        edges = [bin_edges(t, b, lo, hi) for t, b, (lo, hi) in zip(raw_thresholds, bins, bounds)]
+        shape = tuple(len(e) + 1 for e in edges)
+        strides = [int(np.prod(shape[j + 1:])) for j in range(len(shape))]
+        n_cells = int(np.prod(shape))
+
+        # Représentant de chaque bin = milieu entre ses bornes
+        centers = []
+        for feature_edges, (lo, hi) in zip(edges, bounds):
+            limits = np.array([lo] + feature_edges + [hi])
+            centers.append((limits[:-1] + limits[1:]) / 2)
+
+        cell_class = np.empty(n_cells, dtype=np.uint8)
+        cell_confidence = np.empty(n_cells, dtype=np.uint8)
+        for chunk_start in range(0, n_cells, GRID_BUILD_CHUNK):
+            flat = np.arange(chunk_start, min(chunk_start + GRID_BUILD_CHUNK, n_cells))
+            coords = np.unravel_index(flat, shape)
+            df = pd.DataFrame(
+                np.column_stack([centers[j][coords[j]] for j in range(len(shape))]),
+                columns=feature_names
+            )
+            X = scaler.transform(df) if scaler else df.values
+            proba = model.predict_proba(X)
+            cell_class[flat] = np.argmax(proba, axis=1)
+            cell_confidence[flat] = np.round(np.max(proba, axis=1) * 255)
+
+        index = {
+            "edges": edges,
+            "strides": strides,
+            "classes": classes,
+            "cell_class": cell_class,
+            "cell_confidence": cell_confidence,
+        }
+
+        # Erreur contre l'inférence exacte sur des points tirés hors des centres
+        rng = np.random.default_rng(42)
+        holdout = np.column_stack([rng.uniform(lo, hi, GRID_INDEX_HOLDOUT) for lo, hi in bounds])
+        holdout_df = pd.DataFrame(holdout, columns=feature_names)
+        X_holdout = scaler.transform(holdout_df) if scaler else holdout_df.values
+        exact_proba = model.predict_proba(X_holdout)
+        exact_class = classes[np.argmax(exact_proba, axis=1)]
+        cells = [grid_cell(row, edges, strides) for row in holdout]
+        approx_class = classes[cell_class[cells]]
+        approx_confidence = cell_confidence[cells] / 255
+
+        memory_bytes = cell_class.nbytes + cell_confidence.nbytes + sum(8 * len(e) for e in edges)
+        index["stats"] = {
+            "bins_per_feature": dict(zip(feature_names, shape)),
+            "cells": n_cells,
+            "memory_kb": round(memory_bytes / 1024, 2),
+            "memory_budget_kb": round(GRID_INDEX_MAX_MB * 1024, 2),
+            "holdout_size": GRID_INDEX_HOLDOUT,
+            "holdout_error_rate": round(float(np.mean(approx_class != exact_class)), 4),
+            "holdout_confidence_mae": round(float(np.mean(np.abs(approx_confidence - np.max(exact_proba, axis=1)))), 4),
+            "build_seconds": round(time.perf_counter() - start, 3),
+        }
+        error_rate = index["stats"]["holdout_error_rate"]
+        print(f"   Bins per feature: {shape}")
+        print(f"   Holdout error rate: {error_rate:.2%}")
+
+        # Trop d'erreurs : mieux vaut l'inférence exacte que des réponses fausses
+        if error_rate > GRID_INDEX_MAX_ERROR:
+            grid_index_unavailable_reason = (
+                f"Holdout error rate {error_rate:.2%} above GRID_INDEX_MAX_ERROR={GRID_INDEX_MAX_ERROR:.2%}"
+            )
+            print(f"⚠️ {grid_index_unavailable_reason}, grid index skipped")
+            grid_index = None
+            return False
+
+        grid_index = index
+        grid_index_unavailable_reason = None
+        print(f"✅ Grid index built: {n_cells} cells, {index['stats']['memory_kb']} KB")
+        return True
+
+    except Exception as e:
+        print(f"❌ Grid index build failed: {e}")
+        traceback.print_exc()
+        grid_index_unavailable_reason = f"Build failed: {e}"
+        grid_index = None
+        return False
+
+def grid_lookup(input_dict: dict):
+    """Approximate (class, confidence) with a single grid lookup"""
+    features = {**FEATURE_DEFAULTS, **input_dict}
+    values = [features.get(feature, FEATURE_DEFAULTS.get(feature, 0.0)) for feature in feature_names]
+    cell = grid_cell(values, grid_index["edges"], grid_index["strides"])
+    pred_class = int(grid_index["classes"][grid_index["cell_class"][cell]])
+    confidence = grid_index["cell_confidence"][cell] / 255
+    return pred_class, float(confidence)
+
+if GRID_INDEX_ENABLED:
+    build_grid_index()
+
+# ====== EXPLANATIONS ======
+# sklearn trees/forests: path contributions from precomputed per-leaf values (probability units)
+# XGBoost / LightGBM (also as base learners of a StackingClassifier): their built-in TreeSHAP (log-odds units)
+def booster_contributions(estimator, X, n_classes: int) -> np.ndarray:
+    """TreeSHAP contributions (rows x features+1 x classes) in margin units, last row = bias"""
+    if booster_kind(estimator) == "xgboost":
+        import xgboost
+        booster = estimator.get_booster()
+        raw = booster.predict(xgboost.DMatrix(X, feature_names=booster.feature_names), pred_contribs=True)
+    else:
+        raw = estimator.predict(X, pred_contrib=True)
+    raw = np.asarray(raw)
+    n_rows = len(X)
+
+    if n_classes == 2:
+        # Un seul margin (classe 1) : la classe 0 a le margin opposé
+        margin = raw.reshape(n_rows, -1)
+        return np.stack([-margin, margin], axis=2)
+    if raw.ndim == 3:
+        # xgboost : rows x classes x (features+1)
+        return raw.transpose(0, 2, 1)
+    # lightgbm : un bloc de (features+1) colonnes par classe
+    return raw.reshape(n_rows, n_classes, -1).transpose(0, 2, 1)
+
+def build_tree_explainer():
+    """Pick how predictions of the loaded model are explained, and precompute what it needs"""
+    global tree_explainer, explain_unavailable_reason
+
+    n_classes = len(model.classes_)
+
+    if booster_kind(model):
+        learners = [("model", model)]
+        unsupported = []
+        scope = "model"
+    elif hasattr(model, 'final_estimator_') and hasattr(model, 'named_estimators_'):
+        # StackingClassifier : on explique les modèles de base, pas le méta-modèle
+        learners = [(name, est) for name, est in model.named_estimators_.items() if booster_kind(est)]
+        unsupported = [name for name, est in model.named_estimators_.items()
+                       if not isinstance(est, str) and not booster_kind(est)]
+        scope = "base_learners"
+    else:
+        return build_path_explainer()
+
+    if not learners:
+        explain_unavailable_reason = f"{type(model).__name__} has no supported tree learners"
+        print(f"⚠️ {explain_unavailable_reason}, explanations disabled")
+        tree_explainer = None
+        return False
+
+    try:
+        # Le biais TreeSHAP est constant : une ligne suffit pour le lire
+        probe = np.zeros((1, len(feature_names)))
+        base_value = np.stack([booster_contributions(est, probe, n_classes)[0, -1, :] for _, est in learners])
+    except Exception as e:
+        explain_unavailable_reason = f"TreeSHAP unavailable for {type(model).__name__}: {e}"
+        print(f"⚠️ {explain_unavailable_reason}, explanations disabled")
+        tree_explainer = None
+        return False
+
+    tree_explainer = {
+        "method": "treeshap",
+        "units": "log_odds",
+        "scope": scope,
+        "learners": learners,
+        "unsupported_learners": unsupported,
+        "base_value": base_value,
+        "memory_kb": 0.0,
+    }
+    explain_unavailable_reason = None
+    print(f"✅ TreeSHAP explainer ready for: {', '.join(f'{name} ({booster_kind(est)})' for name, est in learners)}")
+    if unsupported:
+        print(f"   ⚠️ Not explained: {', '.join(unsupported)}")
+    return True
+
+def build_path_explainer():
+    """Precompute per-leaf contribution values for the model's decision trees
+
+    Walking down a tree, each split adds (value[child] - value[parent]) to the parent's
+    split feature. These are accumulated once per leaf, so explaining a row is one
+    leaf lookup per tree and a sparse sum. Averaged over the ensemble:
+    base_value + sum(contributions) == predict_proba.
+    """
+    global tree_explainer, explain_unavailable_reason
+
+    from scipy import sparse
+
+    if hasattr(model, 'tree_') and hasattr(model, 'predict_proba'):
+        trees = [model]
+    elif hasattr(model, 'estimators_') and all(
+            hasattr(e, 'tree_') and hasattr(e, 'predict_proba') for e in model.estimators_):
+        # Forêts de classification seulement (les arbres du boosting sont des régresseurs)
+        trees = list(model.estimators_)
+    else:
+        explain_unavailable_reason = f"{type(model).__name__} isn't a tree classifier ensemble"
+        print(f"⚠️ {explain_unavailable_reason}, explanations disabled")
+        tree_explainer = None
+        return False
+
+    n_features = len(feature_names)
+    n_classes = len(model.classes_)
+
+    # Borne haute avant de construire : une feuille stocke au plus min(profondeur, n_features) x n_classes
+    # valeurs (8 octets + 4 octets d'indice CSR chacune)
+    estimated_bytes = sum(
+        int(np.sum(tree.tree_.children_left < 0)) * min(tree.tree_.max_depth, n_features) * n_classes * 12
+        for tree in trees
+    )
+    if estimated_bytes > EXPLAIN_MAX_MB * 1024 * 1024:
+        explain_unavailable_reason = (
+            f"Explainer would need up to {estimated_bytes / 1024 / 1024:.1f} MB "
+            f"(EXPLAIN_MAX_MB={EXPLAIN_MAX_MB:g})"
+        )
+        print(f"⚠️ {explain_unavailable_reason}, explanations disabled")
+        tree_explainer = None
+        return False
+    leaf_blocks = []
+    offsets = []
+    base_value = np.zeros(n_classes)
+    offset = 0
+
+    for tree in trees:
+        t = tree.tree_
+        value = t.value[:, 0, :]
+        value = value / value.sum(axis=1, keepdims=True)
+
+        # Cumul des contributions de la racine à chaque nœud (les parents précèdent leurs enfants)
+        path_values = np.zeros((t.node_count, n_features, n_classes))
+        for node in range(t.node_count):
+            feature = t.feature[node]
+            if feature < 0:
+                continue
+            for child in (t.children_left[node], t.children_right[node]):
+                path_values[child] = path_values[node]
+                path_values[child, feature] += value[child] - value[node]
+
+        is_leaf = t.children_left < 0
+        path_values[~is_leaf] = 0
+        leaf_blocks.append(sparse.csr_matrix(path_values.reshape(t.node_count, -1) / len(trees)))
+
+        base_value += value[0] / len(trees)
+        offsets.append(offset)
+        offset += t.node_count
+
+    leaf_values = sparse.vstack(leaf_blocks).tocsr()
+    memory_bytes = leaf_values.data.nbytes + leaf_values.indices.nbytes + leaf_values.indptr.nbytes
+
+    tree_explainer = {
+        "method": "tree_path",
+        "units": "probability",
+        "scope": "model",
+        "trees": trees,
+        "offsets": np.array(offsets),
+        "leaf_values": leaf_values,
+        "base_value": base_value[None, :],
+        "n_trees": len(trees),
+        "memory_kb": round(memory_bytes / 1024, 2),
+    }
+    explain_unavailable_reason = None
+    print(f"✅ Tree explainer ready: {len(trees)} trees, {offset} nodes, {tree_explainer['memory_kb']} KB")
+    return True
+
+def leaf_indicator(X):
+    """Sparse (rows x all nodes) one-hot of the leaf each row reaches in every tree"""
+    from scipy import sparse
+
+    X32 = np.ascontiguousarray(X, dtype=np.float32)
+    trees = tree_explainer["trees"]
+    leaves = np.column_stack([tree.tree_.apply(X32) for tree in trees]) + tree_explainer["offsets"]
+    n_rows = len(X32)
+    return sparse.csr_matrix(
+        (np.ones(leaves.size), leaves.ravel(), np.arange(0, leaves.size + 1, len(trees))),
+        shape=(n_rows, tree_explainer["leaf_values"].shape[0])
+    )
+
+def compute_contributions(X) -> np.ndarray:
+    """Contributions (rows x learners x features x classes), vectorized over rows and trees"""
+    n_classes = len(model.classes_)
+    if tree_explainer["method"] == "tree_path":
+        flat = (leaf_indicator(X) @ tree_explainer["leaf_values"]).toarray()
+        return flat.reshape(len(X), 1, len(feature_names), n_classes)
+    return np.stack(
+        [booster_contributions(est, X, n_classes)[:, :-1, :] for _, est in tree_explainer["learners"]],
+        axis=1
+    )
+
+def explain_rows(X) -> np.ndarray:
+    """Contributions (rows x learners x features x classes), cached per row"""
+    X = np.asarray(X, dtype=float)
+    n_learners = len(tree_explainer["base_value"])
+    contributions = np.empty((len(X), n_learners, len(feature_names), len(model.classes_)))
+
+    keys = [row.tobytes() for row in X]
+    missing = []
+    with explain_cache_lock:
+        for i, key in enumerate(keys):
+            cached = explain_cache.get(key)
+            if cached is None:
+                missing.append(i)
+            else:
+                explain_cache.move_to_end(key)
+                contributions[i] = cached
+        explain_stats["rows"] += len(X)
+        explain_stats["cache_hits"] += len(X) - len(missing)
+
+    if missing:
+        computed = compute_contributions(X[missing])
+        contributions[missing] = computed
+
+        with explain_cache_lock:
+            for i, values in zip(missing, computed):
+                explain_cache[keys[i]] = values
+            while len(explain_cache) > EXPLAIN_CACHE_SIZE:
+                explain_cache.popitem(last=False)
+
+    return contributions
+
+def format_explanation(contributions: np.ndarray, model_class: int) -> dict:
+    """Explanation for one row (learners x features x classes) and one predicted class"""
+    k = int(np.searchsorted(model.classes_, model_class))
+    base_value = tree_explainer["base_value"]
+    explanation = {
+        "method": tree_explainer["method"],
+        "units": tree_explainer["units"],
+        "scope": tree_explainer["scope"],
+        "class": model_class,
+    }
+
+    if tree_explainer["scope"] == "model":
+        per_feature = {name: round(float(v), 4) for name, v in zip(feature_names, contributions[0, :, k])}
+        explanation["base_value"] = round(float(base_value[0, k]), 4)
+        explanation["contributions"] = per_feature
+        explanation["top_features"] = sorted(per_feature, key=lambda name: -abs(per_feature[name]))[:3]
+        return explanation
+
+    # Stacking : une explication par modèle de base, classement global par |contribution| cumulée
+    explanation["base_learners"] = {
+        name: {
+            "base_value": round(float(base_value[i, k]), 4),
+            "contributions": {f: round(float(v), 4) for f, v in zip(feature_names, contributions[i, :, k])},
+        }
+        for i, (name, _) in enumerate(tree_explainer["learners"])
+    }
+    weight = np.abs(contributions[:, :, k]).sum(axis=0)
+    explanation["top_features"] = [feature_names[j] for j in np.argsort(-weight)[:3]]
+    explanation["unsupported_learners"] = tree_explainer["unsupported_learners"]
+    explanation["note"] = "Explains the stack's base learners; the meta-learner combining them is not decomposed"
+    return explanation
+
+def parse_flag(value) -> bool:
+    """Boolean from "any format" input: true/false, 1/0, yes/no, on/off"""
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y", "on")
+    if isinstance(value, (bool, int, float)):
+        return bool(value)
+    return False
+
+def attach_explanation(response: dict, contributions, model_class: int):
+    """Add the explanation (or why there is none) to a prediction response"""
+    if contributions is not None:
+        response["explanation"] = format_explanation(contributions[0], model_class)
+    else:
+        response["explanation"] = None
+        response["explanation_reason"] = explain_unavailable_reason
+
+if EXPLAIN_ENABLED:
+    build_tree_explainer()
+
+# ====== DEADLINES & INFERENCE QUEUE ======
+def parse_timeout_ms(value, source: str) -> Optional[float]:
+    """Timeout in ms capped at MAX_DEADLINE_MS, or None if missing/invalid"""
+    if value is None or value == "":
+        return None
+    try:
+        timeout_ms = float(value)
+    except (TypeError, ValueError):
+        print(f"⚠️ Invalid {source}: {value!r}, using default deadline")
+        return None
+    if not np.isfinite(timeout_ms) or timeout_ms <= 0:
+        print(f"⚠️ Invalid {source}: {value!r}, using default deadline")
+        return None
+    return min(timeout_ms, MAX_DEADLINE_MS)
+
+def get_deadline(http_request: Request, timeout_ms=None) -> float:
+    """Absolute deadline (time.monotonic) for a request"""
+    timeout_ms = (
+        parse_timeout_ms(http_request.headers.get("x-request-timeout-ms"), "X-Request-Timeout-Ms header")
+        or parse_timeout_ms(timeout_ms, "timeout_ms")
+        or DEFAULT_DEADLINE_MS
+    )
+
+    received_at = getattr(http_request.state, "received_at", time.monotonic())
+    return received_at + timeout_ms / 1000
+
+def model_inference(X, explain: bool = False):
+    """predict + predict_proba (+ contributions), executed in the threadpool"""
+    start = time.perf_counter()
+    prediction = model.predict(X)
+    proba_array = None
+    if hasattr(model, 'predict_proba'):
+        try:
+            proba_array = model.predict_proba(X)
+        except Exception as e:
+            print(f"⚠️ predict_proba error: {e}")
+            traceback.print_exc()
+    latency_ms = (time.perf_counter() - start) * 1000
+
+    # Hors mesure de latence : l'explication est optionnelle
+    contributions = None
+    if explain and tree_explainer is not None:
+        contributions = explain_rows(X)
+    return prediction, proba_array, latency_ms, contributions
+
+async def run_inference(http_request: Request, deadline: float, X, explain: bool = False):
+    """Queue for the model, dropping the work if it expired or the client left"""
+    global inference_waiting
+
+    service_stats["inference_requests"] += 1
+    inference_waiting += 1
+    try:
+        await inference_semaphore.acquire()
+    finally:
+        inference_waiting -= 1
+
+    try:
+        if time.monotonic() > deadline:
+            service_stats["expired"] += 1
+            print("⏰ Deadline exceeded before inference, dropping request")
+            raise HTTPException(504, detail={"error": "Deadline exceeded before inference"})
+
+        if await http_request.is_disconnected():
+            service_stats["client_disconnected"] += 1
+            print("🔌 Client disconnected before inference, dropping request")
+            raise HTTPException(499, detail={"error": "Client closed request"})
+
+        result = await run_in_threadpool(model_inference, X, explain)
+        service_stats["completed"] += 1
+        return result
+    finally:
+        inference_semaphore.release()
+
+# ====== PROFILING ======
+# Nothing here runs (no thread, no tracemalloc) unless /admin/profile is called
+IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "base_events.py")
+
+def require_admin(http_request: Request):
+    """Reject the request unless it carries the admin token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(403, detail={"error": "Admin endpoints disabled (ADMIN_TOKEN not set)"})
+    token = http_request.headers.get("x-admin-token", "")
+    # Bytes: compare_digest rejects non-ASCII str. Starlette decodes headers as latin-1,
+    # so re-encoding as latin-1 gives back the raw bytes the client sent (UTF-8 in practice)
+    if not hmac.compare_digest(token.encode("latin-1"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(401, detail={"error": "Invalid admin token"})
+
+def sample_stacks(stop_event: threading.Event, interval_s: float, counts: dict, include_idle: bool):
+    """Sample every thread's stack until stop_event is set (collapsed-stack counts)"""
+    own_id = threading.get_ident()
+    while not stop_event.wait(interval_s):
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            if not include_idle and os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                frame = frame.f_back
+            stack.append(thread_names.get(thread_id, str(thread_id)))
+
+            key = ";".join(reversed(stack))
+            counts[key] = counts.get(key, 0) + 1
+
+def function_line_range(func):
+    """(filename, first line, last line) of a function in this module"""
+    lines, start = inspect.getsourcelines(func)
+    return inspect.getsourcefile(func), start, start + len(lines) - 1
+
+def allocation_stage(traceback_frames, stage_ranges) -> str:
+    """Which part of the prediction path an allocation belongs to"""
+    for stage, (filename, first, last) in stage_ranges.items():
+        for frame in traceback_frames:
+            if frame.filename == filename and first <= frame.lineno <= last:
+                return stage
+    for frame in traceback_frames:
+        if "sklearn" in frame.filename and "preprocessing" in frame.filename:
+            return "scaler"
+    return "other"
+
+def summarize_allocations(snapshot: tracemalloc.Snapshot, top: int) -> dict:
+    """Top allocation sites plus totals per prediction stage"""
+    stage_ranges = {
+        "prepare_features": function_line_range(prepare_features),
+        "inference": function_line_range(model_inference),
+    }
+
+    by_stage = {}
+    sites = {}
+    for stat in snapshot.statistics("traceback"):
+        stage = allocation_stage(stat.traceback, stage_ranges)
+        totals = by_stage.setdefault(stage, {"size_kb": 0.0, "count": 0})
+        totals["size_kb"] += stat.size / 1024
+        totals["count"] += stat.count
+
+        # Le site = la frame la plus récente de la traceback
+        frame = stat.traceback[-1]
+        site = sites.setdefault((stage, frame.filename, frame.lineno), {"size": 0, "count": 0})
+        site["size"] += stat.size
+        site["count"] += stat.count
+
+    top_sites = []
+    for (stage, filename, lineno), site in sorted(sites.items(), key=lambda item: -item[1]["size"])[:top]:
+        top_sites.append({
+            "stage": stage,
+            "site": f"{filename}:{lineno}",
+            "size_kb": round(site["size"] / 1024, 2),
+            "count": site["count"],
+        })
+
+    for totals in by_stage.values():
+        totals["size_kb"] = round(totals["size_kb"], 2)
+
+    return {"by_stage": by_stage, "top_sites": top_sites}
+
 # ====== ROUTES ======
 @app.get("/")
 async def root():
@@ -439,8 +1296,22 @@ async def health():
     }
 
 @app.post("/predict")
-async def predict(request: PredictionRequest):
-    """Main prediction endpoint - FIXED CONFIDENCE CALCULATION"""
+async def predict(
+    request: PredictionRequest,
+    http_request: Request,
+    mode: str = Query("exact", pattern="^(exact|approximate)$"),
+    explain: bool = False,
+):
+    """Main prediction endpoint - FIXED CONFIDENCE CALCULATION
+
+    mode=approximate answers from the precomputed grid index (GRID_INDEX=1) with a single lookup
+    explain=true (query or body) adds per-feature contributions; it needs the model, so it forces exact mode
+      - sklearn trees/forests: path contributions, base_value + sum == probability of the class
+      - XGBoost / LightGBM, or a stack of them: TreeSHAP of each base learner, in log-odds
+        (the stack's meta-learner is not decomposed)
+    """
+    deadline = get_deadline(http_request, request.timeout_ms)
+    explain = explain or bool(request.explain)
     try:
         print("\n" + "=" * 60)
         print("🤖 PREDICTION REQUEST RECEIVED")
@@ -457,11 +1328,37 @@ async def predict(request: PredictionRequest):
             using_fallback = False
         
         # Convert with aliases
-        input_data = request.model_dump(by_alias=True)
+        input_data = request.model_dump(by_alias=True, exclude={"timeout_ms", "explain"})
         print(f"📥 Input data:")
         for key, value in input_data.items():
             print(f"   {key}: {value}")
         
+        # Approximate mode: one grid lookup, no model call
+        if mode == "approximate":
+            if explain:
+                print("⚠️ Explanation requested, using exact inference instead of the grid index")
+            elif grid_index is not None:
+                original_class, confidence = grid_lookup(input_data)
+                final_class = 1 if original_class == 0 else original_class
+                confidence = max(confidence, 0.01)
+                print(f"🗺️ APPROXIMATE PREDICTION: Class {final_class} (confidence {confidence:.3f})")
+                print("=" * 60)
+                return {
+                    "success": True,
+                    "prediction": final_class,
+                    "original_model_prediction": original_class,
+                    "prediction_label": f"Class {final_class}",
+                    "recommendation": get_prediction_description(final_class),
+                    "confidence": round(confidence, 3),
+                    "timestamp": datetime.now().isoformat(),
+                    "model_type": model_type,
+                    "using_fallback": using_fallback,
+                    "features_used": input_data,
+                    "mode": "approximate"
+                }
+            else:
+                print(f"⚠️ No grid index ({grid_index_unavailable_reason}), falling back to exact inference")
+        
         # Prepare features
         df = prepare_features(input_data)
         print(f"📊 Features prepared: {df.shape}")
@@ -479,12 +1376,17 @@ async def predict(request: PredictionRequest):
             X = df.values
             print("⏭️ No scaler available, using raw data")
         
-        # Predict
-        prediction = model.predict(X)
+        # Predict (queued, dropped if the deadline passed or the client left)
+        prediction, proba_array, primary_latency_ms, contributions = await run_inference(
+            http_request, deadline, X, explain
+        )
         original_class = int(prediction[0])  # Keep original class for confidence calculation
         
         print(f"\n🎯 INITIAL PREDICTION: Class {original_class}")
         
+        # Shadow evaluation of the candidate model (background, sampled)
+        submit_shadow(df, original_class, primary_latency_ms)
+        
         # Handle class 0 if exists (convert to your expected 1-5 range)
         final_class = original_class
         if original_class == 0:
@@ -493,10 +1395,9 @@ async def predict(request: PredictionRequest):
         
         # CONFIDENCE CALCULATION - FIXED VERSION
         confidence = 0.0
-        if hasattr(model, 'predict_proba'):
+        if proba_array is not None:
             try:
-                # Get probabilities for all classes
-                proba_array = model.predict_proba(X)
+                # Probabilities for all classes (computed with the prediction)
                 print(f"📊 Probability array shape: {proba_array.shape}")
                 
                 # Get probabilities for this specific prediction
@@ -552,20 +1453,28 @@ async def predict(request: PredictionRequest):
             "timestamp": datetime.now().isoformat(),
             "model_type": model_type,
             "using_fallback": using_fallback,
-            "features_used": input_data
+            "features_used": input_data,
+            "mode": "exact"
         }
         
+        if explain:
+            attach_explanation(response, contributions, original_class)
+        
         return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error in prediction: {e}")
         traceback.print_exc()
         raise HTTPException(500, detail={"error": str(e)})
 
 @app.post("/predict/simple")
-async def predict_simple(data: dict):
+async def predict_simple(data: dict, http_request: Request):
     """Simple endpoint that accepts any format"""
     try:
+        deadline = get_deadline(http_request, data.get("timeout_ms"))
+        
         print("\n" + "=" * 60)
         print("🤖 SIMPLE PREDICTION REQUEST")
         print("=" * 60)
@@ -612,7 +1521,8 @@ async def predict_simple(data: dict):
         else:
             X = df.values
         
-        prediction = model.predict(X)
+        explain = parse_flag(data.get("explain", False))
+        prediction, proba_array, _, contributions = await run_inference(http_request, deadline, X, explain)
         original_class = int(prediction[0])
         final_class = original_class
         
@@ -622,9 +1532,9 @@ async def predict_simple(data: dict):
         
         # Confidence calculation
         confidence = 0.85
-        if hasattr(model, 'predict_proba'):
+        if proba_array is not None:
             try:
-                proba = model.predict_proba(X)[0]
+                proba = proba_array[0]
                 if original_class < len(proba):
                     confidence = float(proba[original_class])
                 else:
@@ -642,7 +1552,7 @@ async def predict_simple(data: dict):
         print(f"   Confidence: {confidence:.3f}")
         print("=" * 60)
         
-        return {
+        response = {
             "success": True,
             "prediction": final_class,
             "original_model_prediction": original_class,
@@ -655,6 +1565,13 @@ async def predict_simple(data: dict):
             "using_fallback": using_fallback
         }
         
+        if explain:
+            attach_explanation(response, contributions, original_class)
+        
+        return response
+        
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error in simple prediction: {e}")
         return {
@@ -714,6 +1631,132 @@ async def model_info():
         "model_loaded": model is not None,
         "scaler_loaded": scaler is not None,
         "has_predict_proba": has_predict_proba,
+        "grid_index": grid_index["stats"] if grid_index else None,
+        "grid_index_unavailable_reason": grid_index_unavailable_reason,
+        "explanations_available": tree_explainer is not None,
+        "explanation_unavailable_reason": explain_unavailable_reason,
+        "explanation_method": tree_explainer["method"] if tree_explainer else None,
+        "explanation_scope": tree_explainer["scope"] if tree_explainer else None,
+        "explanation_unsupported_learners": tree_explainer["unsupported_learners"] if tree_explainer and "unsupported_learners" in tree_explainer else [],
+        "explainer_memory_kb": tree_explainer["memory_kb"] if tree_explainer else None,
+        "explain_cache": {**explain_stats, "size": len(explain_cache), "max_size": EXPLAIN_CACHE_SIZE},
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/stats")
+async def get_stats():
+    """Inference queue and dropped-work counters"""
+    return {
+        **service_stats,
+        "inference_waiting": inference_waiting,
+        "inference_concurrency": INFERENCE_CONCURRENCY,
+        "default_deadline_ms": DEFAULT_DEADLINE_MS,
+        "shadow_shed": shadow_stats["shed"],
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/admin/profile")
+async def admin_profile(
+    http_request: Request,
+    seconds: float = Query(5.0, gt=0, le=PROFILE_MAX_SECONDS),
+    mode: str = Query("cpu", pattern="^(cpu|alloc)$"),
+    interval_ms: float = Query(5.0, ge=1, le=1000),
+    include_idle: bool = False,
+    top: int = Query(25, ge=1, le=500),
+):
+    """Profile live traffic for N seconds (admin only)
+
+    cpu: sampling profiler, returns collapsed stacks ("a;b;c count") for flamegraph.pl / speedscope
+    alloc: tracemalloc snapshot, returns top allocation sites and totals per stage
+    """
+    require_admin(http_request)
+
+    if profile_lock.locked():
+        raise HTTPException(409, detail={"error": "A profile is already running"})
+
+    async with profile_lock:
+        print(f"\n🔬 PROFILING ({mode}) for {seconds}s...")
+
+        if mode == "cpu":
+            counts = {}
+            stop_event = threading.Event()
+            sampler = threading.Thread(
+                target=sample_stacks,
+                args=(stop_event, interval_ms / 1000, counts, include_idle),
+                name="profiler-sampler",
+                daemon=True,
+            )
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop_event.set()
+                await run_in_threadpool(sampler.join)
+
+            collapsed = "\n".join(f"{stack} {count}" for stack, count in sorted(counts.items()))
+            print(f"🔬 Profile done: {sum(counts.values())} samples, {len(counts)} unique stacks")
+            return PlainTextResponse(collapsed + "\n" if collapsed else "")
+
+        # mode == "alloc"
+        already_tracing = tracemalloc.is_tracing()
+        if not already_tracing:
+            tracemalloc.start(25)
+        try:
+            await asyncio.sleep(seconds)
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if not already_tracing:
+                tracemalloc.stop()
+
+        # Ignore the profiler itself and lazy imports
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "*/linecache.py"),
+        ])
+        summary = await run_in_threadpool(summarize_allocations, snapshot, top)
+        print(f"🔬 Allocation profile done: {len(summary['top_sites'])} sites")
+        return {
+            "mode": "alloc",
+            "seconds": seconds,
+            "traced_current_kb": round(current / 1024, 2),
+            "traced_peak_kb": round(peak / 1024, 2),
+            **summary,
+            "timestamp": datetime.now().isoformat()
+        }
+
+@app.get("/shadow/stats")
+async def get_shadow_stats():
+    """Candidate vs primary model comparison on sampled live traffic"""
+    with shadow_lock:
+        stats = dict(shadow_stats)
+        confusion = dict(shadow_confusion)
+        primary_latencies = list(shadow_primary_latencies)
+        candidate_latencies = list(shadow_candidate_latencies)
+
+    # Confusion matrix : classe primaire -> classe candidate -> nombre
+    confusion_matrix = {}
+    for (primary_class, candidate_class), count in sorted(confusion.items()):
+        confusion_matrix.setdefault(str(primary_class), {})[str(candidate_class)] = count
+
+    agreement_rate = stats["agreements"] / stats["scored"] if stats["scored"] else None
+
+    return {
+        "enabled": shadow_model is not None,
+        "candidate_model_file": SHADOW_MODEL_FILE,
+        "candidate_model_type": type(shadow_model).__name__ if shadow_model else None,
+        "sample_rate": SHADOW_SAMPLE_RATE,
+        "queue_size": SHADOW_QUEUE_SIZE,
+        "queue_depth": shadow_queue.qsize(),
+        **stats,
+        "agreement_rate": round(agreement_rate, 4) if agreement_rate is not None else None,
+        "confusion_matrix": confusion_matrix,
+        "latency": {
+            "primary": summarize_latencies(primary_latencies),
+            "candidate": summarize_latencies(candidate_latencies),
+        },
         "timestamp": datetime.now().isoformat()
     }
 
@@ -724,6 +1767,8 @@ if __name__ == "__main__":
     print(f"🌐 Server: http://localhost:8000")
     print(f"🤖 Predict: POST http://localhost:8000/predict")
     print(f"📊 Model Info: GET http://localhost:8000/model-info")
+    print(f"📈 Stats: GET http://localhost:8000/stats")
+    print(f"👥 Shadow Stats: GET http://localhost:8000/shadow/stats")
     print(f"🧪 Test: GET http://localhost:8000/test")
     print(f"📚 Docs: http://localhost:8000/docs")
     print("=" * 60)
@@ -12,6 +12,10 @@ const ML_API_URL = process.env.ML_API_URL || 'http://localhost:8000/predict';
 const ML_SERVICE_ENABLED = process.env.ML_SERVICE_ENABLED === 'true';
 const PREDICTION_RETENTION_DAYS = parseInt(process.env.PREDICTION_RETENTION_DAYS) || 3;
 
+// axios timeouts, also sent as X-Request-Timeout-Ms so the ML service drops the work once we stop waiting
+const ML_TIMEOUT_MS = 15000;
+const ML_TEST_TIMEOUT_MS = 5000;
+
 console.log(`🌱 ML Service Configuration:`);
 console.log(`   URL: ${ML_API_URL}`);
 console.log(`   Enabled: ${ML_SERVICE_ENABLED}`);
@@ -107,10 +111,11 @@ router.post('/', async (req, res) => {
     let mlResponse;
     try {
       mlResponse = await axios.post(ML_API_URL, features, {
-        timeout: 15000,
+        timeout: ML_TIMEOUT_MS,
         headers: {
           'Content-Type': 'application/json',
-          'X-Request-ID': requestId
+          'X-Request-ID': requestId,
+          'X-Request-Timeout-Ms': String(ML_TIMEOUT_MS)
         }
       });
       
@@ -709,8 +714,11 @@ router.post('/test-ml', async (req, res) => {
     };
     
     const response = await axios.post(ML_API_URL, testData, {
-      timeout: 5000,
-      headers: { 'Content-Type': 'application/json' }
+      timeout: ML_TEST_TIMEOUT_MS,
+      headers: {
+        'Content-Type': 'application/json',
+        'X-Request-Timeout-Ms': String(ML_TEST_TIMEOUT_MS)
+      }
     });
     
     res.json({